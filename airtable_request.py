@@ -3,94 +3,259 @@
 This module abstracts and accounts for paging when sending requests to the Airtable API
 """
 import os
+import re
+import time
+import logging
+import orjson
 import requests
-from typing import Tuple, Dict
-from funcy import get_in, partial
+from threading import Lock
+from concurrent.futures import ThreadPoolExecutor
+from cachetools import TTLCache
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+from typing import Dict, Iterator
+from funcy import get_in
 from dotenv import load_dotenv
 
+logger = logging.getLogger(__name__)
+
 # load env variables
 load_dotenv()
 AIRTABLE_API_KEY = os.getenv('AIRTABLE_API_KEY')
 BASE_NAME = os.getenv('BASE_NAME')
 TABLE_NAME = os.getenv('TABLE_NAME')
 MAX_AIRTABLE_PATCH = 10
+MAX_AIRTABLE_PAGE_SIZE = 100
+# Airtable allows 5 requests per second per base. The `limiter` only counts this process's requests, so the
+# Procfile runs a single (gevent) worker; running N workers would need this divided by N
+MAX_AIRTABLE_REQUESTS_PER_SECOND = 5
+MAX_CONCURRENT_REQUESTS = MAX_AIRTABLE_REQUESTS_PER_SECOND
 
 headers = {'Authorization': "Bearer " + AIRTABLE_API_KEY}
+json_headers = {'Content-Type': 'application/json'}
 url = 'https://api.airtable.com/v0/{0}/{1}'.format(BASE_NAME, TABLE_NAME)
+SINGLE_URL_PREFIX = url + '/'
+
+# Airtable record ids are "rec" + 14 alphanumerics, so anything else can't be one (and is never put in a formula)
+RECORD_ID_PATTERN = re.compile(r'^rec[A-Za-z0-9]{14}$')
+
+
+class RateLimiter:
+    """ Thread-safe token bucket shared by every Airtable request in the process
+
+    Up to `rate` requests can go out back-to-back, after which callers wait for tokens to refill
+    at `rate` per `per` seconds, instead of sleeping a fixed interval before every request.
+
+    Attributes:
+        capacity: Maximum number of tokens the bucket holds
+        tokens: Number of tokens currently available
+        fill_rate: Tokens added back per second
+    """
+    def __init__(self, rate: int, per: float = 1.0):
+        """ Creates a full :obj:`RateLimiter` allowing `rate` requests every `per` seconds """
+        self.capacity = rate
+        self.tokens = float(rate)
+        self.fill_rate = rate / per
+        self.last_refill = time.monotonic()
+        self.lock = Lock()
+
+    def acquire(self):
+        """ Blocks until a token is available, then consumes it """
+        while True:
+            with self.lock:
+                now = time.monotonic()
+                self.tokens = min(self.capacity, self.tokens + (now - self.last_refill) * self.fill_rate)
+                self.last_refill = now
+
+                if self.tokens >= 1:
+                    self.tokens -= 1
+                    return
+                wait = (1 - self.tokens) / self.fill_rate
+            time.sleep(wait)
+
+
+limiter = RateLimiter(MAX_AIRTABLE_REQUESTS_PER_SECOND)
+
+# one pooled, keep-alive session so each request doesn't pay for a new TCP + TLS handshake
+session = requests.Session()
+session.headers.update(headers)
+adapter = HTTPAdapter(pool_connections=4, pool_maxsize=10,
+                      max_retries=Retry(total=3, backoff_factor=0.3, status_forcelist=[429, 500, 502, 503, 504]))
+session.mount('https://', adapter)
+
+
+def send_request(method: str, request_url: str, **kwargs) -> Dict:
+    """ Sends a rate-limited request over the shared session and parses the response
+
+    A `json` payload is serialized, and the response parsed, with orjson rather than the stdlib json.
+
+    Args:
+        method: String denoting what type of request ("get", "post", "patch) etc
+        request_url: The Airtable API url to send the request to
+        **kwargs: Any additional arguments accepted by :meth:`requests.Session.request`
+
+    Returns:
+        Dict with the parsed JSON response (empty if the response has no body)
+
+    Raises:
+        requests.HTTPError: If Airtable responds with an error status
+    """
+    payload = kwargs.pop('json', None)
+    if payload is not None:
+        kwargs['data'] = orjson.dumps(payload)
+        kwargs['headers'] = {**json_headers, **kwargs.get('headers', {})}
+
+    limiter.acquire()
+    response = session.request(method, request_url, **kwargs)
+    response.raise_for_status()
+    return orjson.loads(response.content) if response.content else {}
+
+def airtable_request(method: str, **kwargs) -> Dict:
+    """ Sends a request to the Airtable table endpoint over the shared session
+
+    Args:
+        method: String denoting what type of request ("get", "post", "patch) etc
+        **kwargs: Any additional arguments accepted by :meth:`requests.Session.request`
+
+    Returns:
+        Dict with the parsed JSON response from the Airtable API
+
+    Raises:
+        requests.HTTPError: If Airtable responds with an error status
+    """
+    return send_request(method, url, **kwargs)
+
+# shared pool for sending independent requests in parallel
+executor = ThreadPoolExecutor(max_workers=MAX_CONCURRENT_REQUESTS)
+
+# recently fetched records keyed by record id, dropped whenever we patch that record
+record_cache = TTLCache(maxsize=1024, ttl=60)
+record_cache_lock = Lock()
+
+
+def cache_records(records: list):
+    """ Stores Airtable records in the `record_cache`
+
+    Args:
+        records: List of Airtable records, each with an `id`
+    """
+    with record_cache_lock:
+        for record in records:
+            record_cache[record['id']] = record
+
+def invalidate_cached_records(records: list):
+    """ Drops any cached copy of the records about to be changed in Airtable
 
-airtable_request = partial(requests.request, url=url, headers=headers)
+    Args:
+        records: List of Airtable API-friendly records, each with an `id`
+    """
+    with record_cache_lock:
+        for record in records:
+            record_cache.pop(record.get('id'), None)
 
 
 def single_airtable_request(record_id) -> Dict:
-    """ An Airtable get request for a single record 
+    """ An Airtable get request for a single record, served from the `record_cache` when possible
     
     Args:
-        payload: Airtable API-friendly dictionary with contents of request
-        request_type: String denoting what type of request ("get", "post", "patch) etc
+        record_id: Id of the Airtable record to retrieve
     
     Returns:
-        Empty Airtable API-friendly payload template
+        Dict with the Airtable record
+
+    Raises:
+        requests.HTTPError: If Airtable responds with an error status (i.e. the record doesn't exist)
     """
-    single_url = 'https://api.airtable.com/v0/{0}/{1}/{2}'.format(BASE_NAME, TABLE_NAME, record_id)
-    ar = partial(requests.request, url=single_url, headers=headers)
-    return ar("get")
+    with record_cache_lock:
+        record = record_cache.get(record_id)
+    if record is not None:
+        return record
 
-def update_payload_state(payload: dict, request_type: str) -> Dict:
-    """ Abstracts paging from airtable requests
+    record = send_request("get", SINGLE_URL_PREFIX + record_id)
+    cache_records([record])
+    return record
+
+def batched(iterable, n: int = MAX_AIRTABLE_PATCH) -> Iterator[list]:
+    """ Groups an iterable into lists of at most `n` items, to fit Airtable's per-request limits
 
-    If the payload's record count is at the MAX_AIRTABLE_PATCH number, then
-    the method sends the request, and returns an empty payload template.
+    Examples:
+        >>> list(batched(range(5), 2))
+        [[0, 1], [2, 3], [4]]
 
     Args:
-        payload: Airtable API-friendly dictionary with contents of request
-        request_type: String denoting what type of request ("get", "post", "patch) etc
+        iterable: The items (usually Airtable API-friendly records) to group
+        n: Maximum number of items per batch
 
     Returns:
-        If the payload is sent, returns an empty Airtable API-friendly payload template.
-        Else, returns the inputted payload 
+        Iterator of lists with at most `n` items, the last one possibly shorter
     """
-    if len(payload['records']) >= MAX_AIRTABLE_PATCH:
-        _ = airtable_request(request_type, json=payload)
-        payload = {"records": [], "typecast": True}
-    return payload
+    batch = []
+    for item in iterable:
+        batch.append(item)
+        if len(batch) == n:
+            yield batch
+            batch = []
+    if batch:
+        yield batch
+
+def batch_get_records(record_ids: list) -> Dict:
+    """ Airtable get requests for many records at once, keyed by record id
+
+    Rather than one request per record, the ids are chunked into groups of MAX_AIRTABLE_PAGE_SIZE
+    and each group is fetched with a single `filterByFormula` list request. The groups are
+    fetched concurrently, and records already in the `record_cache` are not requested again.
+    Duplicate ids are only requested once, and ids that don't match `RECORD_ID_PATTERN` are never requested.
+
+    Examples:
+        >>> batch_get_records(["rec38xfjrf30jxojr", "rec33pd201jfxojrk", "Agenda"])
+        {"rec38xfjrf30jxojr": {"id": "rec38xfjrf30jxojr", "fields": {...}}, ...}
 
-def update_payload_states(patch_payload: dict, create_payload: dict) -> Tuple[dict, dict]:
-    """ Method to abstract paging from 2 sets of payloads (patch + post) 
-    
     Args:
-        patch_payload: Airtable API-friendly dictionary with contents of patch requests
-        create_payload: Airtable API-friendly dictionary with contents of post requests
+        record_ids: List of Airtable record ids to retrieve
 
     Returns:
-        Tuple of the updated patch_payload and create_payload
+        Dict mapping each found record id to its Airtable record
     """
-    patch_payload = update_payload_state(patch_payload, "patch")
-    create_payload = update_payload_state(create_payload, "post")
+    def get_chunk(chunk: list) -> Dict:
+        formula = "OR(" + ",".join(f"RECORD_ID()='{record_id}'" for record_id in chunk) + ")"
+        params = {"filterByFormula": formula, "pageSize": MAX_AIRTABLE_PAGE_SIZE}
+        return airtable_request("get", params=params)
+
+    record_ids = [record_id for record_id in dict.fromkeys(record_ids) if RECORD_ID_PATTERN.match(record_id)]
+
+    records = dict()
+    with record_cache_lock:
+        for record_id in record_ids:
+            if record_id in record_cache:
+                records[record_id] = record_cache[record_id]
+
+    missing_ids = [record_id for record_id in record_ids if record_id not in records]
 
-    return patch_payload, create_payload
+    for response in executor.map(get_chunk, batched(missing_ids, MAX_AIRTABLE_PAGE_SIZE)):
+        fetched = response.get('records', [])
+        cache_records(fetched)
+        records.update({record['id']: record for record in fetched})
 
-def send_nonempty_payload(payload: dict, request_type: str):
+    return records
+
+def send_payloads(records: list, request_type: str):
     """ Abstracts paging from airtable requests
 
-    If the payload's record count is greater than 0, then
-    the method sends the request, and returns an empty payload template. This method is usually
-    used at the end when all records are processed.
+    Splits the records into payloads of MAX_AIRTABLE_PATCH records and sends them concurrently.
+    Nothing is sent if there are no records. Since the payloads aren't sent in order, each record id
+    should appear at most once (merge the fields of duplicates first).
 
     Args:
-        payload: Airtable API-friendly dictionary with contents of request
-        request_type: String denoting what type of request ("get", "post", "patch) etc
-    """
-    print(payload)
-    if len(payload['records']) > 0:
-        _ = airtable_request(request_type, json=payload)
-        print(_)
+        records: List of Airtable API-friendly records ({"id": ..., "fields": {...}})
+        request_type: String denoting what type of request ("post", "patch") etc
 
-def send_nonempty_payloads(patch_payload: dict, create_payload: dict):
-    """ Method to abstract paging from 2 sets of payloads (patch + post) at the end of paging iteration
-    
-    Args:
-        patch_payload: Airtable API-friendly dictionary with contents of patch requests
-        create_payload: Airtable API-friendly dictionary with contents of post requests
+    Returns:
+        List of the parsed responses, in the same order as the records
     """
-    patch_payload = send_nonempty_payload(patch_payload, "patch")
-    create_payload = send_nonempty_payload(create_payload, "post")
\ No newline at end of file
+    invalidate_cached_records(records)
+
+    def send(batch: list):
+        logger.debug('Sending %s payload: %s', request_type, batch)
+        return airtable_request(request_type, json={"records": batch, "typecast": True})
+
+    return list(executor.map(send, batched(records)))
@@ -3,20 +3,26 @@
 This module combines the Flask app, the logic to processing gcal webhooks, and updating the Postgres database
 """
 import os
-import time
-import arrow
-from typing import Dict, Tuple
+import json
+import hashlib
+import logging
+import threading
+import diskcache
+from concurrent.futures import Future
+from functools import lru_cache
+from typing import Dict, Optional, Tuple
 from datetime import datetime, timedelta
-from funcy import get_in
-from flask import Flask, request, jsonify, Response
+from flask import Flask, jsonify, Response
 from flask_sqlalchemy import SQLAlchemy
 from sqlalchemy.sql import func
 from dotenv import load_dotenv
 
-from calendar_request import Calendar
-from airtable_request import airtable_request, update_payload_state, send_nonempty_payload, single_airtable_request
+from calendar_request import Calendar, execute_pooled
+from airtable_request import airtable_request, send_payloads, batch_get_records
 load_dotenv()
 
+logger = logging.getLogger(__name__)
+
 app = Flask(__name__)
 app.config['SQLALCHEMY_DATABASE_URI'] = os.environ['DATABASE_URL']
 app.config['SQLALCHEMY_TRACK_MODIFICATIONS'] = False
@@ -25,11 +31,27 @@ db = SQLAlchemy(app)
 CALENDAR_ID = os.getenv('CALENDAR_ID')
 calendar = Calendar(CALENDAR_ID)
 
+# calendar event id -> linked airtable record id + etag of the event version last synced (kept for a day)
+event_cache = diskcache.Cache('./event_cache')
+EVENT_CACHE_EXPIRE = 86400
+
+# digests of (record id, update fields) being patched right now -> the sending webhook's :obj:`Future`,
+# so concurrent duplicate webhooks don't re-send them
+in_flight_patches = dict()
+in_flight_lock = threading.Lock()
+
 GCAL_COLOR_MAPPING = {
     "5": "Done", # yellow ish
     "11": "Abandoned" # red ish
 } # some GCAL magic variables here
 
+# (calendar feature getter, airtable field to compare against, airtable default, airtable fields to update)
+FIELD_DIFFS = [
+    (lambda event: (event.get('end') or {}).get('dateTime', "")[0:10], 'Deadline', "", ['Deadline', 'lastCalendarDeadline']),
+    (lambda event: (event.get('end') or {}).get('dateTime', ""), 'endTime', "", ['endTime']),
+    (lambda event: event.get('summary'), 'name', 0, ['Name']),
+]
+
 
 class Snapshot(db.Model):
     """ Snapshot defines the model for a Postgres database entry
@@ -83,10 +105,9 @@ def parse_event_description(event: dict) -> Tuple[str, str]:
     Returns:
         Tuple of `airtable_record_id` and `source`
     """
-    string_to_parse = get_in(event, ['description'], "").split(" ")
-    airtable_record_id, source = string_to_parse[0], string_to_parse[1:2] or None
-    if source:
-        source = source[0]
+    description = event.get('description') or ""
+    airtable_record_id, separator, rest = description.partition(" ")
+    source = (rest.partition(" ")[0] or None) if separator else None
     return airtable_record_id, source
 
 
@@ -99,10 +120,41 @@ def parse_event_duration(event: dict) -> float:
     Returns:
         Duration in hours (float)
     """
-    start = get_in(event, ['start', 'dateTime'])
-    end = get_in(event, ['end', 'dateTime'])
+    start = (event.get('start') or {}).get('dateTime')
+    end = (event.get('end') or {}).get('dateTime')
+
+    return duration_from_iso(start, end)
+
 
-    return (arrow.get(end) - arrow.get(start)).seconds / 3600
+@lru_cache(maxsize=4096)
+def duration_from_iso(start: str, end: str) -> float:
+    """ Memoized helper that computes the duration between two ISO 8601 datetime strings
+
+    Args:
+        start: The event's start `dateTime`
+        end: The event's end `dateTime`
+
+    Returns:
+        Duration in hours (float)
+    """
+    return (parse_iso_datetime(end) - parse_iso_datetime(start)).total_seconds() / 3600
+
+
+def parse_iso_datetime(value: str) -> datetime:
+    """ Parses a Gcal ISO 8601 `dateTime` (i.e. "2020-11-27T10:00:00-08:00" or "2020-11-27T18:00:00Z")
+
+    Note:
+        :meth:`datetime.fromisoformat` only accepts a trailing "Z" from Python 3.11, so it's swapped for "+00:00"
+
+    Args:
+        value: The ISO 8601 datetime string
+
+    Returns:
+        The timezone-aware datetime
+    """
+    if value.endswith('Z'):
+        value = value[:-1] + '+00:00'
+    return datetime.fromisoformat(value)
 
 
 def create_payload_from_event(event: dict) -> Dict:
@@ -114,45 +166,56 @@ def create_payload_from_event(event: dict) -> Dict:
     Returns:
         The Airtable-friendly payload dictionary with the necessary info
     """
+    deadline = (event.get('end') or {}).get('dateTime', "")[0:10]
     return {
         "fields": {
-            "Name": get_in(event, ["summary"]),
+            "Name": event.get('summary'),
             "duration": parse_event_duration(event),
-            "Deadline": get_in(event, ["end", "dateTime"], "")[0:10],
-            "lastCalendarDeadline": get_in(event, ["end", "dateTime"], "")[0:10],
-            "calendarEventId": get_in(event, ['id'])
+            "Deadline": deadline,
+            "lastCalendarDeadline": deadline,
+            "calendarEventId": event.get('id')
         }
     }
 
 
-def process_new_event(event: dict, calendar: Calendar):
+def process_new_event(event: dict, calendar: Calendar, batch: list = None) -> Optional[str]:
     """ Create an Airtable record for the new event, then link the record with the event
 
     Args:
         event: Dictionary that stores the event's information
         calendar: The :obj:`calendar_request.Calendar` associated with the calendar we're editting
+        batch: (optional) Batch from :meth:`calendar_request.Calendar.new_batch` to queue the event patch in
+
+    Returns:
+        Id of the created Airtable record (None if the event was cancelled, so nothing was created or queued)
     """
-    if get_in(event, ["status"], "cancelled") == "cancelled":
-        return
+    if event.get('status', "cancelled") == "cancelled":
+        return None
 
     # Create Airtable Record
     payload = {"records": [create_payload_from_event(event)], "typecast": True}
-    response = airtable_request("post", json=payload).json()
+    response = airtable_request("post", json=payload)
 
     # get airtable id
     airtable_record_id = response['records'][0]['id']
 
     # attach to airtable_record_id to event description
-    calendar_event_id = get_in(event, ['id'])
-    calendar.patch_event(calendar_event_id, airtable_record_id)
+    calendar_event_id = event.get('id')
+    calendar.patch_event(calendar_event_id, airtable_record_id, batch=batch)
 
-    return
+    return airtable_record_id
 
 
-def process_change(update_fields: dict, calendar_feature, airtable_feature, airtable_field_names: list) -> Dict:
-    """ Processes change in `calendar_feature` relative to the airtable record
+def diff_event_against_record(event: dict, record: dict) -> Dict:
+    """ Compares a Gcal event against its Airtable record in a single pass
 
-    If the `calendar_feature` doesn't match the `airtable_feature`, then it updates the `airtable_feature`
+    Walks `FIELD_DIFFS` once, and for each calendar feature that doesn't match the airtable feature,
+    sets the corresponding Airtable fields to the calendar value. The computed `duration` and the
+    `color_id` transition to `Done` or `Abandoned` are handled after the table:
+
+    1. Check if the calendar event's `color_id` is changed
+    2. Get the `Status` corresponding to the `color_id`
+    3. If this Status doesn't match the airtable, then update the airtable `Status` (and `lastStatus`)
 
     Note:
         If there is a change from the Airtable side and the Gcal webhook side within the same minute,
@@ -160,121 +223,91 @@ def process_change(update_fields: dict, calendar_feature, airtable_feature, airt
         instantaneous, therefore the Airtable change will be acting on top of the Gcal webhook change.
 
     Args:
-        update_fields: The payload dictionary that will be sent in a patch/post request to the Airtable API
-        calendar_feature: The feature in the calendar's event to be compared
-        airtable_feature: The feature in the Airtable's record to be compared
-        airtable_field_names: A list of the fields to be updated in Airtable with the `calendar_feature` value
-
-    Returns:
-        An updated-version of `update_fields` to be sent to airtable in a patch/post request
-    """
-    print(f'{airtable_field_names}: cal({calendar_feature}) and air({airtable_feature})')
-    if calendar_feature != airtable_feature:
-        for field in airtable_field_names:
-            update_fields.update({
-                field: calendar_feature,
-            })
-
-    return update_fields
-
-
-def process_deadline_change(update_fields: dict, event: dict, record: dict) -> Dict:
-    """ Processes change in `Deadline` relative to the airtable record
-
-    Args:
-        update_fields: The payload dictionary that will be sent in a patch/post request to the Airtable API
-        event: event: Dictionary that stores the event's information
-        record: The individual record being processed
-
-    Returns:
-        An updated-version of `update_fields` to be sent to airtable in a patch/post request
-    """
-    calendar_datetime = get_in(event, ['end',  'dateTime'], "")[0:10]
-    airtable_datetime = get_in(record, ['fields', 'Deadline'], "")
-    return process_change(update_fields, calendar_datetime, airtable_datetime, ['Deadline', 'lastCalendarDeadline'])
-
-def process_endtime_change(update_fields: dict, event: dict, record: dict) -> Dict:
-    """ Processes change in `endTime` relative to the airtable record
-
-    Args:
-        update_fields: The payload dictionary that will be sent in a patch/post request to the Airtable API
-        event: event: Dictionary that stores the event's information
+        event: Dictionary that stores the event's information
         record: The individual record being processed
 
     Returns:
-        An updated-version of `update_fields` to be sent to airtable in a patch/post request
+        The fields to be sent to airtable in a patch request (empty if nothing changed)
     """
-    calendar_endtime = get_in(event, ['end', 'dateTime'], "")
-    airtable_endtime = get_in(record, ['fields', 'endTime'], "")
-    return process_change(update_fields, calendar_endtime, airtable_endtime, ['endTime'])
+    update_fields = dict()
+    airtable_fields = record.get('fields') or {}
+    debug = logger.isEnabledFor(logging.DEBUG)
+
+    for get_calendar_feature, airtable_field, airtable_default, airtable_field_names in FIELD_DIFFS:
+        calendar_feature = get_calendar_feature(event)
+        airtable_feature = airtable_fields.get(airtable_field, airtable_default)
+        if debug:
+            logger.debug('%s: cal(%s) and air(%s)', airtable_field_names, calendar_feature, airtable_feature)
+        if calendar_feature != airtable_feature:
+            for field in airtable_field_names:
+                update_fields[field] = calendar_feature
 
-def process_duration_change(update_fields: dict, event: dict, record: dict) -> Dict:
-    """ Processes change in `duration` relative to the airtable record
+    calendar_duration = parse_event_duration(event)
+    airtable_duration = airtable_fields.get('duration', 0)
+    if debug:
+        logger.debug('%s: cal(%s) and air(%s)', ['duration'], calendar_duration, airtable_duration)
+    if calendar_duration != airtable_duration:
+        update_fields['duration'] = calendar_duration
+
+    new_status = GCAL_COLOR_MAPPING.get(event.get('colorId', ""))
+    if debug and new_status:
+        logger.debug('Changed-Color? : new(%s) and air(%s)', new_status, airtable_fields.get('Status', ""))
+    if new_status and new_status != airtable_fields.get('Status', ""):
+        update_fields['Status'] = new_status
+        update_fields['lastStatus'] = "Done"
 
-    Args:
-        update_fields: The payload dictionary that will be sent in a patch/post request to the Airtable API
-        event: event: Dictionary that stores the event's information
-        record: The individual record being processed
+    return update_fields
 
-    Returns:
-        An updated-version of `update_fields` to be sent to airtable in a patch/post request
-    """
-    calendar_duration = parse_event_duration(event)
-    airtable_duration = get_in(record, ["fields", "duration"], 0)
-    return process_change(update_fields, calendar_duration, airtable_duration, ['duration'])
+def claim_patch(airtable_record_id: str, update_fields: dict, patches_sent: Future) -> Optional[Future]:
+    """ Claims a patch for this webhook to send, unless a concurrent webhook is already sending the exact same one
 
-def process_name_change(update_fields: dict, event: dict, record: dict) -> Dict:
-    """ Processes change in `Name` relative to the airtable record
+    Only patches still in flight are deduplicated (see `in_flight_patches`), so a patch that failed, or a record
+    changed back to an earlier value (X -> Y -> X), is always sent again.
 
     Args:
-        update_fields: The payload dictionary that will be sent in a patch/post request to the Airtable API
-        event: event: Dictionary that stores the event's information
-        record: The individual record being processed
+        airtable_record_id: Id of the Airtable record being patched
+        update_fields: The fields that would be sent in the patch request
+        patches_sent: :obj:`Future` this webhook resolves once its patches are sent (see :func:`release_patches`)
 
     Returns:
-        An updated-version of `update_fields` to be sent to airtable in a patch/post request
+        None if the patch was claimed (and should be sent), else the :obj:`Future` of the webhook already sending it
     """
-    calendar_name = get_in(event, ['summary'])
-    airtable_name = get_in(record, ["fields", "name"], 0)
-    return process_change(update_fields, calendar_name, airtable_name, ['Name'])
-
-def transition_done_record(update_fields: dict, event: dict, record: dict) -> Dict:
-    """ Detects whether the `color_id` of an event is changed to the color corresponding to `Done` or `Abandoned`
-
-    1. Check if the calendar event's `color_id` is changed
-    2. Get the `Status` corresponding to the `color_id`
-    3. If this Status doesn't match the airtable, then update the airtable `Status` (and `lastStatus`)
+    content = airtable_record_id + json.dumps(update_fields, sort_keys=True)
+    key = hashlib.blake2b(content.encode(), digest_size=16).digest()
+    with in_flight_lock:
+        sender = in_flight_patches.get(key)
+        if sender is None:
+            in_flight_patches[key] = patches_sent
+    return sender
 
-    Note:
-        If there is a change from the Airtable side and the Gcal webhook side within the same minute,
-        the Airtable change will likely win out, since it changes on a minute basis, while the webhook is relatively
-        instantaneous, therefore the Airtable change will be acting on top of the Gcal webhook change.
+def release_patches(patches_sent: Future, error: Exception = None):
+    """ Releases every patch claimed with `patches_sent`, then resolves it for any webhook waiting on those patches
 
     Args:
-        update_fields: The payload dictionary that will be sent in a patch/post request to the Airtable API
-        event: event: Dictionary that stores the event's information
-        record: The individual record being processed
-
-    Returns:
-        An updated-version of `update_fields` to be sent to airtable in a patch/post request
+        patches_sent: The :obj:`Future` the patches were claimed with in :func:`claim_patch`
+        error: (optional) The exception the patches failed with, passed on to the waiting webhooks
     """
-    color_id = get_in(event, ['colorId'], "")
+    with in_flight_lock:
+        for key in [key for key, sender in in_flight_patches.items() if sender is patches_sent]:
+            del in_flight_patches[key]
 
-    if color_id in GCAL_COLOR_MAPPING.keys():
-        new_status = GCAL_COLOR_MAPPING[color_id]
-        airtable_status = get_in(record, ["fields", "Status"], "")
+    if error is not None:
+        patches_sent.set_exception(error)
+    else:
+        patches_sent.set_result(None)
 
-        print(f'Changed-Color? : new({new_status}) and air({airtable_status})')
-        if new_status != airtable_status:
-            update_fields.update({
-                "Status": new_status,
-                "lastStatus": "Done",
-            })
+def process_event_change(events):
+    """Batching airtable changes with 10 records per request, sent concurrently
 
-    return update_fields
+    Linked events whose `etag` matches the version last synced (see `event_cache`) haven't changed,
+    so they are skipped without fetching or diffing their Airtable record. Events whose description doesn't
+    name a record Airtable returns are skipped too, so no patch is ever sent for an id that doesn't exist.
+    A patch a concurrent webhook is already sending isn't sent twice; its events are only cached as synced
+    once that webhook's patches succeed.
 
-def process_event_change(events):
-    """Batching airtable changes with 10 records per request 
+    Raises:
+        RuntimeError: If any new event couldn't be linked to its Airtable record (raised once the rest
+            of the page is handled, so the sync token isn't saved)
 
     Args:
         events (List[dict]): A single page of events 
@@ -283,34 +316,89 @@ def process_event_change(events):
         https://developers.google.com/calendar/v3/reference/events
     """
     if events.get('items'):
-        patch_payload = {"records": [], "typecast": True}
-
+        update_records = dict()
+        patch_records = []
+        synced_events = []
+        concurrent_patches = []
+        patches_sent = Future()
+        calendar_batch = calendar.new_batch()
+        new_links = [] # (event id, record id) of each link patch, in `calendar_batch` order
+        failed_links = []
+
+        changed_events = []
         for event in events['items']:
-            patch_payload = update_payload_state(patch_payload, "patch")
-            airtable_record_id, source = parse_event_description(event)
+            airtable_record_id, _ = parse_event_description(event)
+            cached = event_cache.get(event.get('id')) if airtable_record_id else None
+            if cached and cached['etag'] == event.get('etag'):
+                continue
+            changed_events.append((event, airtable_record_id))
+
+        # fetch every linked record up front, rather than one request per event
+        records = batch_get_records([record_id for _, record_id in changed_events if record_id])
 
+        for event, airtable_record_id in changed_events:
             if not airtable_record_id:
-                print(event)
-                process_new_event(event, calendar)
-                continue            
-
-            record = single_airtable_request(airtable_record_id).json()
-            time.sleep(0.2) # make sure we don't exceed 5 Airtable calls / second
-            
-            update_fields = dict()
-            update_fields = process_deadline_change(update_fields, event, record)
-            update_fields = process_endtime_change(update_fields, event, record)
-            update_fields = process_duration_change(update_fields, event, record)
-            update_fields = process_name_change(update_fields, event, record)
-            update_fields = transition_done_record(update_fields, event, record)
+                logger.debug('New event: %s', event)
+                new_record_id = process_new_event(event, calendar, batch=calendar_batch)
+                if new_record_id:
+                    new_links.append((event.get('id'), new_record_id))
+                continue
 
-            if update_fields:
-                patch_payload['records'].append({
-                    "id": airtable_record_id,
-                    "fields": update_fields
-                })
+            record = records.get(airtable_record_id)
+            if record is None:
+                # not a record Airtable knows (i.e. someone else's event whose description starts with "Agenda")
+                logger.debug('No Airtable record %s for event %s, skipping', airtable_record_id, event.get('id'))
+                continue
+
+            update_fields = diff_event_against_record(event, record)
 
-        send_nonempty_payload(patch_payload, "patch")
+            if update_fields:
+                # recurring event instances share one record: merge their fields in page order (the last wins),
+                # so the concurrently sent patch batches never touch the same record twice
+                update_records.setdefault(airtable_record_id, {}).update(update_fields)
+            synced_events.append((event, airtable_record_id))
+
+        def collect_failed_link(request_id, response, exception):
+            if exception is not None:
+                event_id, new_record_id = new_links[int(request_id)]
+                logger.error('Failed to link event %s to its new Airtable record %s: %s',
+                             event_id, new_record_id, exception)
+                failed_links.append(exception)
+
+        # link the new events to the records just created before anything else can fail,
+        # otherwise a retried sync would create every new event's record again
+        calendar.flush_batch(calendar_batch, callback=collect_failed_link)
+
+        # claim the patches only right before sending them, and release them however the send ends,
+        # so a failure can never leave a claim in `in_flight_patches` that no webhook will resolve
+        try:
+            for airtable_record_id, update_fields in update_records.items():
+                sender = claim_patch(airtable_record_id, update_fields, patches_sent)
+                if sender is None:
+                    patch_records.append({
+                        "id": airtable_record_id,
+                        "fields": update_fields
+                    })
+                else:
+                    concurrent_patches.append(sender)
+
+            send_payloads(patch_records, "patch")
+        except BaseException as error:
+            release_patches(patches_sent, error)
+            raise
+        release_patches(patches_sent)
+
+        # raises (so nothing below is cached as synced) if the concurrent webhook's patches failed
+        for sender in concurrent_patches:
+            sender.result()
+
+        for event, airtable_record_id in synced_events:
+            event_cache.set(event['id'], {'rid': airtable_record_id, 'etag': event.get('etag')},
+                            expire=EVENT_CACHE_EXPIRE)
+
+        if failed_links:
+            message = f'{len(failed_links)} new event(s) could not be linked to their Airtable records'
+            raise RuntimeError(message) from failed_links[0]
     return
 
 def get_todays_information() -> Dict:
@@ -346,31 +434,40 @@ def get_todays_information() -> Dict:
               "filterByFormula": formula}
 
     # TODO: Error Handling
-    return airtable_request('get', params=params).json()
+    return airtable_request('get', params=params)
+
+def prefetch_events_page(**kwargs) -> Future:
+    """ Starts fetching a page of calendar events in the background
+
+    Args:
+        **kwargs: Arguments for the Gcal events list request (i.e. `syncToken` or `pageToken`)
+
+    Returns:
+        :obj:`concurrent.futures.Future` that resolves to the page of events
+    """
+    page_request = calendar.service.events().list(calendarId=CALENDAR_ID, **kwargs)
+    return calendar.execute_async(page_request)
 
 @app.route('/webhook', methods=['POST'])
 def respond_webhook():
     """ API Route that is response for handling Gcal webhooks """
-    print(request.json)
-    print(request.headers)
-
-    # retrieve sync token and calendar events
-    syncToken = db.session.query(Snapshot).order_by(Snapshot.id.desc()).first().syncToken
-    events = calendar.service.events().list(calendarId=CALENDAR_ID, syncToken=syncToken).execute()
+    # retrieve sync token (just the column, not the whole Snapshot) and calendar events
+    syncToken = db.session.query(Snapshot.syncToken).order_by(Snapshot.id.desc()).limit(1).scalar()
+    events = execute_pooled(calendar.service.events().list(calendarId=CALENDAR_ID, syncToken=syncToken))
 
-    # process each page
+    # process each page, while the next page is fetched in the background
     while events.get('nextPageToken'):
-        print(len(events['items']))
+        logger.debug('Processing page of %d events', len(events['items']))
+        next_page = prefetch_events_page(pageToken=events['nextPageToken'])
 
         process_event_change(events)
 
-        time.sleep(1) # to make sure we don't get an error from Gcal for too many requests
-        events = events = calendar.service.events().list(calendarId=CALENDAR_ID, pageToken=events['nextPageToken']).execute()
+        events = next_page.result()
 
     # process last page
     process_event_change(events)
 
-    # insert sync token into postgres
+    # insert sync token into postgres, committing the same transaction the token lookup began
     new_record = Snapshot(events['nextSyncToken'])
     db.session.add(new_record)
     db.session.commit()
@@ -381,9 +478,6 @@ def respond_webhook():
 @app.route('/day', methods=['GET'])
 def respond_day():
     """ API Route that is response for handling requests for today's information (used by Desktop + Mobile app) """
-    print(request.json)
-    print(request.headers)
-
     # TODO: Authentication with hashes
 
     return get_todays_information()
@@ -397,7 +491,10 @@ def index():
 
 
 if __name__ == '__main__':
-    # Threaded option to enable multiple instances for multiple user access support
+    logging.basicConfig(level=logging.WARNING)
+
+    # Local development only: in production the Procfile runs
+    # `gunicorn app:app -k gevent -w 1 --worker-connections 100` so blocking outbound requests are cooperative
     app.run(threaded=True, port=5000)
     # res = get_todays_information()
     # print(res)
\ No newline at end of file
@@ -2,27 +2,299 @@
 
 This module creates a class for simplified interfacing with the Google Calendar API.
 """
+import time
+import queue
+import logging
+import threading
+from contextlib import contextmanager
+from concurrent.futures import Future, ThreadPoolExecutor
 from datetime import datetime, timedelta
-from typing import Dict
+from functools import lru_cache
+from typing import Callable, Dict, List, Optional
+from urllib.parse import quote
 
-from google.oauth2 import service_account
+import orjson
+import httplib2
+import google_auth_httplib2
+from cachetools import LRUCache
+from google.auth.transport.requests import AuthorizedSession
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
 from googleapiclient.discovery import build
 
-SCOPES = ['https://www.googleapis.com/auth/calendar']
-SERVICE_ACCOUNT_FILE = './service-account-credentials.json'
+from creds import get_credentials
+
+logger = logging.getLogger(__name__)
+
+EVENTS_URL = 'https://www.googleapis.com/calendar/v3/calendars/{0}/events'
+JSON_HEADERS = {'Content-Type': 'application/json'}
 
 TIMEZONE = 'UTC'
+SOURCE_TAG = 'webhook' # appended to the airtable record id in event descriptions, to mark who wrote the event
+MAX_BATCH_REQUESTS = 50 # Gcal allows at most 50 requests per batch
+MAX_CONCURRENT_REQUESTS = 10
+HTTP_TIMEOUT = 30 # seconds
+PATCH_DEBOUNCE = 0.3 # seconds to wait for more patches to the same event before sending
+BATCH_WAIT = 0.05 # seconds the batch worker waits for more requests after the first one arrives
+
+# worker threads for :meth:`Calendar.execute_async`, each borrowing a connection from the `http_pool`
+executor = ThreadPoolExecutor(max_workers=MAX_CONCURRENT_REQUESTS)
+
+# (calendar_id, event_id) -> (etag, event) of recently seen events, revalidated on every :meth:`Calendar.get_event`
+etag_cache = LRUCache(maxsize=1024)
+etag_cache_lock = threading.Lock()
+
+# (request, future) pairs queued by the *_async methods, drained into batches by the `batch_worker`
+request_queue = queue.Queue()
+
+@lru_cache(maxsize=None)
+def build_service():
+    """ Builds the Google Calendar v3 service once per process, to be shared by every :obj:`Calendar`
+
+    The discovery document bundled with googleapiclient is used, rather than fetching it over HTTPS.
+    The service's own connection isn't safe to share between threads or greenlets, so its requests should be
+    sent on a connection from the `http_pool` instead (see :func:`execute_pooled`).
+
+    Returns:
+        Instantiated Google Calendar v3 service
+    """
+    return build('calendar', 'v3', http=authorized_http(), static_discovery=True, cache_discovery=False)
+
+@lru_cache(maxsize=None)
+def authorized_session() -> AuthorizedSession:
+    """ Creates the thread-safe, keep-alive session used to call the Gcal REST API directly
+
+    Its connection pool holds up to MAX_CONCURRENT_REQUESTS connections to www.googleapis.com, so concurrent
+    requests reuse open connections rather than each doing a new TCP + TLS handshake.
+
+    Returns:
+        :obj:`google.auth.transport.requests.AuthorizedSession` authorized with the shared credentials
+    """
+    session = AuthorizedSession(get_credentials())
+    adapter = HTTPAdapter(pool_connections=1, pool_maxsize=MAX_CONCURRENT_REQUESTS,
+                          max_retries=Retry(total=3, backoff_factor=0.3, status_forcelist=[429, 500, 502, 503, 504]))
+    session.mount('https://', adapter)
+    return session
+
+def authorized_http() -> google_auth_httplib2.AuthorizedHttp:
+    """ Creates a persistent, keep-alive connection authorized with the shared credentials
+
+    Returns:
+        An :obj:`google_auth_httplib2.AuthorizedHttp`, which must only be used by one thread at a time
+    """
+    return google_auth_httplib2.AuthorizedHttp(get_credentials(), http=httplib2.Http(timeout=HTTP_TIMEOUT))
+
+@lru_cache(maxsize=None)
+def http_pool() -> queue.Queue:
+    """ Creates the pool of MAX_CONCURRENT_REQUESTS connections shared by the `executor` threads
+
+    Connections are reused across requests (saving a TLS handshake per request), and bounding the pool
+    bounds the number of outbound connections.
+
+    Returns:
+        :obj:`queue.Queue` holding the idle :obj:`google_auth_httplib2.AuthorizedHttp` connections
+    """
+    pool = queue.Queue()
+    for _ in range(MAX_CONCURRENT_REQUESTS):
+        pool.put(authorized_http())
+    return pool
+
+@contextmanager
+def pooled_http():
+    """ Borrows a connection from the `http_pool`, blocking until one is free, and returns it once done
+
+    Yields:
+        An idle :obj:`google_auth_httplib2.AuthorizedHttp`
+    """
+    pool = http_pool()
+    http = pool.get()
+    try:
+        yield http
+    finally:
+        pool.put(http)
+
+def execute_pooled(api_request):
+    """ Executes a Gcal API request on a connection borrowed from the `http_pool`
+
+    Args:
+        api_request (googleapiclient.http.HttpRequest): The request to execute
+
+    Returns:
+        Dict with the Gcal API's response to the request
+    """
+    with pooled_http() as http:
+        return api_request.execute(http=http)
+
+def drain_request_queue() -> List:
+    """ Blocks for the next queued request, then takes any more that arrive within BATCH_WAIT seconds
+
+    Returns:
+        List of at most MAX_BATCH_REQUESTS (request, future) pairs
+    """
+    items = [request_queue.get()]
+    deadline = time.monotonic() + BATCH_WAIT
+    while len(items) < MAX_BATCH_REQUESTS:
+        timeout = deadline - time.monotonic()
+        if timeout <= 0:
+            break
+        try:
+            items.append(request_queue.get(timeout=timeout))
+        except queue.Empty:
+            break
+    return items
+
+def send_queued_batch(items: List):
+    """ Sends queued requests as one BatchHttpRequest, resolving each request's future with its response
+
+    Args:
+        items (list): (request, future) pairs from :func:`drain_request_queue`
+    """
+    items = [(api_request, future) for api_request, future in items if future.set_running_or_notify_cancel()]
+    if not items:
+        return
+
+    def resolve(request_id, response, exception):
+        future = items[int(request_id)][1]
+        if exception is not None:
+            future.set_exception(exception)
+        else:
+            future.set_result(response)
+
+    try:
+        http_batch = build_service().new_batch_http_request(callback=resolve)
+        for i, (api_request, _) in enumerate(items):
+            http_batch.add(api_request, request_id=str(i))
+
+        with pooled_http() as http:
+            http_batch.execute(http=http)
+    except Exception as exception:
+        for _, future in items:
+            if not future.done():
+                future.set_exception(exception)
+
+def batch_worker():
+    """ Background loop that keeps sending queued requests in batches of up to MAX_BATCH_REQUESTS
+
+    A batch that fails only fails its own futures, the loop carries on with the next batch.
+    """
+    while True:
+        try:
+            send_queued_batch(drain_request_queue())
+        except Exception:
+            logger.exception('Gcal batch worker failed to send a batch')
+
+@lru_cache(maxsize=None)
+def start_batch_worker() -> threading.Thread:
+    """ Starts the daemon thread running the :func:`batch_worker`, the first time it's needed
+
+    Returns:
+        The running worker thread
+    """
+    worker = threading.Thread(target=batch_worker, name='gcal-batch-worker', daemon=True)
+    worker.start()
+    return worker
+
+def encode_json(body: Dict) -> bytes:
+    """ Serializes a request body with orjson, which encodes any datetimes itself (UTC as "Z")
+
+    Args:
+        body (dict): The request body
+
+    Returns:
+        The JSON-encoded body
+    """
+    return orjson.dumps(body, option=orjson.OPT_UTC_Z)
+
+def build_create_body(title, start, end, airtable_record_id, timezone=TIMEZONE, source_tag=SOURCE_TAG) -> Dict:
+    """ Builds the body of a Gcal event insert request in a single dict literal
+
+    The event schema is fixed, so the whole nested body is built in one expression, instead of a dict per
+    field being created and merged.
+
+    Args:
+        title (str): A string containing the event title/name
+        start: The event's start time, as a datetime (for :func:`encode_json`) or an ISO string
+        end: The event's end time, in the same form as `start`
+        airtable_record_id (str): Id corresponding to the airtable record representation for this event
+        timezone (str): (optional) The timezone in which the event should be encoded
+        source_tag (str): (optional) Tag after the airtable record id in the description
+
+    Returns:
+        Dict with the event to insert
+    """
+    return {
+        'summary': title,
+        'description': f'{airtable_record_id} {source_tag}',
+        'start': {'dateTime': start, 'timeZone': timezone},
+        'end': {'dateTime': end, 'timeZone': timezone},
+    }
+
+def build_patch_body(airtable_record_id, color_id=None, title=None, start=None, duration=1, timezone=TIMEZONE,
+                     source_tag=SOURCE_TAG, as_iso=True) -> Dict:
+    """ Builds the body of a Gcal event patch request (see :meth:`Calendar.patch_event` for the arguments)
+
+    Args:
+        as_iso (bool): Whether to format the start/end times as ISO strings (needed by googleapiclient requests),
+            or leave them as datetimes for :func:`encode_json`
+
+    Returns:
+        Dict with the event fields to patch
+    """
+    event_body = {'description': f'{airtable_record_id} {source_tag}'}
+    if color_id:
+        event_body['colorId'] = color_id
+    if title:
+        event_body['summary'] = title
+    if start:
+        end = start + timedelta(hours=duration)
+        if as_iso:
+            start, end = start.isoformat(), end.isoformat()
+        event_body['start'] = {'dateTime': start, 'timeZone': timezone}
+        event_body['end'] = {'dateTime': end, 'timeZone': timezone}
+
+    return event_body
+
+def completed_future(result) -> Future:
+    """ Wraps an already known result in a :obj:`concurrent.futures.Future`
+
+    Args:
+        result: The value the future resolves to
+
+    Returns:
+        The resolved :obj:`concurrent.futures.Future`
+    """
+    future = Future()
+    future.set_result(result)
+    return future
+
+def log_batch_error(request_id, response, exception):
+    """ Default :meth:`Calendar.flush_batch` callback, which reports any request in the batch that failed
+
+    Args:
+        request_id (str): The request's position in the batch
+        response (dict): The Gcal API's response to the request (None if it failed)
+        exception (Exception): The error raised by the request (None if it succeeded)
+    """
+    if exception is not None:
+        logger.warning('Batch request %s failed: %s', request_id, exception)
 
 class Calendar:
     """ This class contains the necessary information to interact with the Google Calendar API
     for a specific calendar.
 
-    It proves methods to GET, PATCH, and POST events.
+    It proves methods to GET, PATCH, and POST events. Each method sends its request immediately (straight to the
+    REST endpoint, skipping the discovery-based `service`), unless given a `batch` from :meth:`new_batch`,
+    in which case the request is queued until :meth:`flush_batch`.
+    The `*_async` variants queue the request for a background worker, which sends whatever has queued up
+    together as one batch, and return a :obj:`concurrent.futures.Future` for the request's response.
     
     Attributes:
         calendar_id: String containing the Google Calendar UUID 
-        credentials: Google Credentials stored in the service-account-credential.json
-        service: Instantitated Google Calendar v3 service
+        credentials: Google Credentials stored in the service-account-credential.json (shared across instances)
+        service: Instantitated Google Calendar v3 service, built on first use (shared across instances)
+        session: Authorized session for direct REST requests (shared across instances)
+        events_url: The calendar's precomputed events endpoint
+        pending_patches: Merged patch bodies keyed by event id, waiting to be sent by :meth:`flush_pending_patches`
     """
     def __init__(self, calendar_id: str):
         """ Creates a :obj:`Calendar` object 
@@ -31,12 +303,174 @@ class Calendar:
             calendar_id (str): The string containing the Gcal UUID for which we want to instantiate a :obj:`calendar`
         """
         self.calendar_id = calendar_id
-        self.credentials = service_account.Credentials.from_service_account_file(
-            SERVICE_ACCOUNT_FILE, scopes=SCOPES)
+        self.credentials = get_credentials()
+        self.session = authorized_session()
+        self.events_url = EVENTS_URL.format(quote(calendar_id, safe=''))
+
+        self.pending_patches = dict()
+        self.pending_lock = threading.Lock()
+        self.patch_timer = None
+
+    @property
+    def service(self):
+        """ Gets the Google Calendar v3 service, building it on first use so handlers that never touch
+        the discovery-based API skip its construction
+
+        Returns:
+            Instantiated Google Calendar v3 service
+        """
+        service = self.__dict__.get('_service')
+        if service is None:
+            service = build_service()
+            self.__dict__['_service'] = service
+        return service
+
+    def new_batch(self) -> List:
+        """ Creates an empty batch to queue requests in, instead of sending each one immediately
+
+        Returns:
+            The batch to pass as `batch` to :meth:`create_event`, :meth:`patch_event`, and :meth:`get_event`
+        """
+        return []
+
+    def flush_batch(self, batch: List, callback: Callable = None, http=None):
+        """ Sends every request queued in `batch`, as BatchHttpRequests of at most MAX_BATCH_REQUESTS
+
+        Args:
+            batch (list): The batch from :meth:`new_batch`, emptied once sent
+            callback (Callable): (optional) Called as `callback(request_id, response, exception)` per request,
+                where `request_id` is the request's position (as a string) in the batch. Defaults to
+                logging any failed requests.
+            http (google_auth_httplib2.AuthorizedHttp): (optional) The connection to send the batches on,
+                defaults to one borrowed from the `http_pool`
+        """
+        if http is None:
+            with pooled_http() as http:
+                return self.flush_batch(batch, callback=callback, http=http)
+
+        callback = callback or log_batch_error
+        for offset in range(0, len(batch), MAX_BATCH_REQUESTS):
+            http_batch = self.service.new_batch_http_request(callback=callback)
+            for i, batch_request in enumerate(batch[offset:offset + MAX_BATCH_REQUESTS], start=offset):
+                http_batch.add(batch_request, request_id=str(i))
+            http_batch.execute(http=http)
+
+        batch.clear()
+
+    def execute_async(self, api_request) -> Future:
+        """ Executes a Gcal API request from a worker thread
+
+        Args:
+            api_request (googleapiclient.http.HttpRequest): The request to execute (i.e. `service.events().list(...)`)
+
+        Returns:
+            :obj:`concurrent.futures.Future` that resolves to the Gcal API's response
+        """
+        return executor.submit(execute_pooled, api_request)
+
+    def enqueue(self, api_request) -> Future:
+        """ Queues a Gcal API request for the background batch worker, and returns immediately
+
+        Args:
+            api_request (googleapiclient.http.HttpRequest): The request to send
+
+        Returns:
+            :obj:`concurrent.futures.Future` that resolves to the Gcal API's response
+        """
+        start_batch_worker()
+        future = Future()
+        request_queue.put((api_request, future))
+        return future
+
+    def create_event_async(self, *args, **kwargs) -> Future:
+        """ Same as :meth:`create_event`, but queued for the background batch worker
+
+        Returns:
+            :obj:`concurrent.futures.Future` that resolves to the Gcal API's response to the insert request
+        """
+        batch = self.new_batch()
+        self.create_event(*args, batch=batch, **kwargs)
+        return self.enqueue(batch[0])
 
-        self.service = build('calendar', 'v3', credentials=self.credentials)
+    def patch_event_async(self, *args, **kwargs) -> Future:
+        """ Same as :meth:`patch_event`, but queued for the background batch worker
 
-    def create_event(self, title, start, airtable_record_id, duration=1, timezone=TIMEZONE) -> Dict:
+        Returns:
+            :obj:`concurrent.futures.Future` that resolves to the Gcal API's response to the patch request
+            (or to None if there's no `event_id`)
+        """
+        batch = self.new_batch()
+        self.patch_event(*args, batch=batch, **kwargs)
+        return self.enqueue(batch[0]) if batch else completed_future(None)
+
+    def get_event_async(self, *args, **kwargs) -> Future:
+        """ Same as :meth:`get_event`, but queued for the background batch worker
+
+        Returns:
+            :obj:`concurrent.futures.Future` that resolves to the Gcal API's response to the get request
+            (or to None if there's no `event_id`)
+        """
+        batch = self.new_batch()
+        self.get_event(*args, batch=batch, **kwargs)
+        return self.enqueue(batch[0]) if batch else completed_future(None)
+
+    def event_url(self, event_id: str) -> str:
+        """ Gets the REST endpoint of a single event in this calendar
+
+        Args:
+            event_id (str): String containing the Id for the Gcal event
+
+        Returns:
+            The event's url
+        """
+        return self.events_url + '/' + quote(event_id, safe='')
+
+    def patch_event_debounced(self, event_id, airtable_record_id, **kwargs):
+        """ Queues a patch to be merged with any other patches to the same event within PATCH_DEBOUNCE seconds
+
+        Only the merged patch per event is sent, so a burst of edits to one event costs a single request.
+        The pending patches are sent together in a batch once no new patch arrives for PATCH_DEBOUNCE seconds,
+        or immediately once MAX_BATCH_REQUESTS events are pending.
+
+        Args:
+            event_id (str): String containing the Id for the existing Gcal event to be edited
+            airtable_record_id (str): Id corresponding to the airtable record representation for this event
+            **kwargs: Any of the optional arguments of :meth:`patch_event` (except `batch`)
+        """
+        if not event_id:
+            return
+
+        event_body = build_patch_body(airtable_record_id, **kwargs)
+        with self.pending_lock:
+            self.pending_patches.setdefault(event_id, {}).update(event_body)
+            flush_now = len(self.pending_patches) >= MAX_BATCH_REQUESTS
+
+            if self.patch_timer is not None:
+                self.patch_timer.cancel()
+            if not flush_now:
+                self.patch_timer = threading.Timer(PATCH_DEBOUNCE, self.flush_pending_patches)
+                self.patch_timer.daemon = True
+                self.patch_timer.start()
+
+        if flush_now:
+            self.flush_pending_patches()
+
+    def flush_pending_patches(self):
+        """ Sends every patch queued by :meth:`patch_event_debounced`, in batches on a pooled connection """
+        with self.pending_lock:
+            pending_patches, self.pending_patches = self.pending_patches, dict()
+            if self.patch_timer is not None:
+                self.patch_timer.cancel()
+                self.patch_timer = None
+
+        batch = [self.service.events().patch(calendarId=self.calendar_id, eventId=event_id, body=event_body)
+                 for event_id, event_body in pending_patches.items()]
+        if batch:
+            with pooled_http() as http:
+                self.flush_batch(batch, http=http)
+
+    def create_event(self, title, start, airtable_record_id, duration=1, timezone=TIMEZONE, source_tag=SOURCE_TAG,
+                     batch=None) -> Dict:
         """ Create a Google Calendar event in the specified calendar object
 
         Args:
@@ -45,29 +479,81 @@ class Calendar:
             airtable_record_id (str): Id corresponding to the airtable record representation for this event
             duration (float): The duration (in hours) that the event should last
             timezone (str): (optional) The timezone in which the event should be encoded
+            source_tag (str): (optional) Tag after the airtable record id in the description (i.e. "webhook", "s3")
+            batch (list): (optional) If present, the batch from :meth:`new_batch` to queue the request in
 
         Returns:
-            Dict with the Gcal API's response to the insert request
-        """
-        event_body = {
-            'summary': title,
-            'description': airtable_record_id + " webhook",
-            'start': {
-                'dateTime': start.isoformat(),
-                'timeZone': timezone,
-            },
-            'end': {
-                'dateTime': (start + timedelta(hours=duration)).isoformat(),
-                'timeZone': timezone,
-            }
-        }
-
-        created_event = self.service.events().insert(calendarId=self.calendar_id, body=event_body).execute()
-        print('Event created: %s' % (created_event.get('htmlLink')))
+            Dict with the Gcal API's response to the insert request (None if queued in a `batch`)
+
+        Raises:
+            requests.HTTPError: If the Gcal API responds with an error status
+        """
+        end = start + timedelta(hours=duration)
+        if batch is not None:
+            # googleapiclient serializes with the stdlib json, so batched bodies need ISO strings
+            start, end = start.isoformat(), end.isoformat()
+
+        event_body = build_create_body(title, start, end, airtable_record_id, timezone, source_tag)
+
+        if batch is not None:
+            batch.append(self.service.events().insert(calendarId=self.calendar_id, body=event_body))
+            return None
+
+        response = self.session.post(self.events_url, data=encode_json(event_body), headers=JSON_HEADERS)
+        response.raise_for_status()
+        created_event = orjson.loads(response.content)
+        self.cache_event(created_event)
+        logger.info('Event created: %s', created_event.get('htmlLink'))
 
         return created_event
 
-    def patch_event(self, event_id, airtable_record_id, color_id=None, title=None, start=None, duration=1, timezone=TIMEZONE):
+    def create_events_bulk(self, titles, starts, durations, airtable_record_ids, timezone=TIMEZONE,
+                           source_tag=SOURCE_TAG) -> List[Optional[str]]:
+        """ Create many Google Calendar events at once, sent as batches of MAX_BATCH_REQUESTS
+
+        The events are given as parallel lists (one entry per event), and all of the datetime formatting is
+        done up front, before any request bodies are built.
+
+        Args:
+            titles (List[str]): The event titles/names
+            starts (List[datetime]): The start times for the events
+            durations (List[float]): The durations (in hours) that the events should last
+            airtable_record_ids (List[str]): Ids corresponding to the airtable record representations for the events
+            timezone (str): (optional) The timezone in which the events should be encoded
+            source_tag (str): (optional) Tag after the airtable record id in the descriptions (i.e. "webhook", "s3")
+
+        Returns:
+            List with the Gcal event id of each created event, in the same order as the inputs
+            (None for any event that failed to be created). Only the id is kept from each response,
+            so the full event bodies are never held in memory at once
+
+        Raises:
+            ValueError: If the lists aren't all the same length
+        """
+        if not len(titles) == len(starts) == len(durations) == len(airtable_record_ids):
+            raise ValueError('titles, starts, durations, and airtable_record_ids must be the same length')
+
+        delta = timedelta # local lookup inside the comprehension
+        start_isos = [start.isoformat() for start in starts]
+        end_isos = [(start + delta(hours=duration)).isoformat() for start, duration in zip(starts, durations)]
+
+        insert = self.service.events().insert
+        batch = [insert(calendarId=self.calendar_id,
+                        body=build_create_body(title, start_iso, end_iso, airtable_record_id, timezone, source_tag))
+                 for title, airtable_record_id, start_iso, end_iso in zip(titles, airtable_record_ids, start_isos, end_isos)]
+
+        event_ids = [None] * len(batch)
+        def collect(request_id, response, exception):
+            if exception is not None:
+                log_batch_error(request_id, response, exception)
+            else:
+                event_ids[int(request_id)] = response['id']
+
+        self.flush_batch(batch, callback=collect)
+        return event_ids
+
+    def patch_event(self, event_id, airtable_record_id, color_id=None, title=None, start=None, duration=1, timezone=TIMEZONE,
+                    source_tag=SOURCE_TAG, batch=None):
         """ Patch a Google Calendar event in the specified calendar object
 
         Args:
@@ -78,45 +564,73 @@ class Calendar:
             start (datetime): (optional) If present, the new start time for the event
             duration (float): (optional) If present, the new duration (in hours) for the event
             timezone (str): (optional) If present, the timezone in which the event should be encoded 
+            source_tag (str): (optional) Tag after the airtable record id in the description (i.e. "webhook", "s3")
+            batch (list): (optional) If present, the batch from :meth:`new_batch` to queue the request in
         
         Returns:
-            Dict with the Gcal API's response to the patch request
+            Dict with the Gcal API's response to the patch request (None if queued in a `batch`)
+
+        Raises:
+            requests.HTTPError: If the Gcal API responds with an error status
         """
         if not event_id:
             return None
 
-        event_body = {'description': airtable_record_id + " webhook"}
-        if color_id:
-            event_body.update({'colorId': color_id})
-        if start:
-            event_body.update({
-                'start': {
-                    'dateTime': start.isoformat(),
-                    'timeZone': timezone,
-                },
-                'end': {
-                    'dateTime': (start + timedelta(hours=duration)).isoformat(),
-                    'timeZone': timezone,
-                },
-            })
-        if title:
-            event_body.update({'summary': title,})
-
-        patched_event = self.service.events().patch(calendarId=self.calendar_id, eventId=event_id, body=event_body).execute()
-        print('Event patched: %s' % (patched_event.get('htmlLink')))
+        event_body = build_patch_body(airtable_record_id, color_id, title, start, duration, timezone, source_tag,
+                                      as_iso=batch is not None)
+        if batch is not None:
+            batch.append(self.service.events().patch(calendarId=self.calendar_id, eventId=event_id, body=event_body))
+            return None
+
+        response = self.session.patch(self.event_url(event_id), data=encode_json(event_body), headers=JSON_HEADERS)
+        response.raise_for_status()
+        patched_event = orjson.loads(response.content)
+        self.cache_event(patched_event)
+        logger.info('Event patched: %s', patched_event.get('htmlLink'))
 
         return patched_event
     
-    def get_event(self, event_id):
+    def cache_event(self, event: Dict):
+        """ Remembers an event and its `etag`, so :meth:`get_event` can revalidate instead of re-downloading it
+
+        Args:
+            event (dict): The Gcal API's representation of the event
+        """
+        if event and event.get('etag'):
+            with etag_cache_lock:
+                etag_cache[(self.calendar_id, event['id'])] = (event['etag'], event)
+
+    def get_event(self, event_id, batch=None):
         """ Get a Google Calendar event in the specified calendar object
 
+        If the event was seen recently, the request is sent with its `etag` (If-None-Match), and the cached
+        event is returned when Gcal responds 304 Not Modified.
+
         Args:
             event_id (str): String containing the Id for the existing Gcal event to retrieve 
+            batch (list): (optional) If present, the batch from :meth:`new_batch` to queue the request in
         
         Returns:
-            Dict with the Gcal API's response to the get request
+            Dict with the Gcal API's response to the get request (None if queued in a `batch`)
+
+        Raises:
+            requests.HTTPError: If the Gcal API responds with an error status
         """
         if not event_id:
             return None
 
-        return self.service.events().get(calendarId=self.calendar_id, eventId=event_id).execute()
+        if batch is not None:
+            batch.append(self.service.events().get(calendarId=self.calendar_id, eventId=event_id))
+            return None
+
+        with etag_cache_lock:
+            etag, cached_event = etag_cache.get((self.calendar_id, event_id), (None, None))
+
+        response = self.session.get(self.event_url(event_id), headers={'If-None-Match': etag} if etag else None)
+        if response.status_code == 304:
+            return cached_event
+
+        response.raise_for_status()
+        event = orjson.loads(response.content)
+        self.cache_event(event)
+        return event
@@ -0,0 +1,95 @@
+""" creds.py
+
+This module loads the Google service account credentials once per process, so every caller shares them.
+The access token is also cached on disk whenever it's refreshed, so newly started workers can reuse a token
+that is still valid.
+"""
+import os
+import json
+import tempfile
+from datetime import datetime
+from functools import lru_cache
+
+from google.oauth2 import service_account
+
+SCOPES = ['https://www.googleapis.com/auth/calendar']
+SERVICE_ACCOUNT_FILE = './service-account-credentials.json'
+
+# shared memory (if available) so the token never touches a real disk
+TOKEN_CACHE_DIR = '/dev/shm' if os.path.isdir('/dev/shm') else tempfile.gettempdir()
+
+
+class CachedTokenCredentials(service_account.Credentials):
+    """ Service account credentials that write every refreshed access token to the token cache
+
+    The token is refreshed lazily as usual (on the first request, then whenever it expires), so the cache
+    always holds the newest token rather than only the first one.
+    """
+    def refresh(self, request):
+        """ Refreshes the access token, then saves it for the next worker to start (see :func:`save_token`)
+
+        Args:
+            request (google.auth.transport.Request): The transport used to make the token request
+        """
+        super().refresh(request)
+        save_token(self)
+
+
+def token_cache_path(credentials: service_account.Credentials) -> str:
+    """ Gets where the access token for these credentials is cached, keyed by the service account key's id
+
+    Args:
+        credentials: The service account credentials
+
+    Returns:
+        Path of the token cache file
+    """
+    key_id = getattr(credentials.signer, 'key_id', None) or 'default'
+    return os.path.join(TOKEN_CACHE_DIR, f'gcal_token_{key_id}.json')
+
+def load_cached_token(credentials: service_account.Credentials):
+    """ Sets the credentials' token and expiry from the token cache, if there is one
+
+    An expired token is still loaded, since the credentials will simply refresh it on first use.
+
+    Args:
+        credentials: The service account credentials
+    """
+    try:
+        with open(token_cache_path(credentials)) as f:
+            cached = json.load(f)
+        credentials.token = cached['token']
+        credentials.expiry = datetime.fromisoformat(cached['expiry'])
+    except (OSError, ValueError, KeyError, TypeError):
+        return
+
+def save_token(credentials: service_account.Credentials):
+    """ Atomically writes the credentials' token and expiry to the token cache (readable by this user only)
+
+    Args:
+        credentials: The service account credentials, with a token
+    """
+    path = token_cache_path(credentials)
+    tmp_path = f'{path}.{os.getpid()}.tmp'
+    try:
+        fd = os.open(tmp_path, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o600)
+        with os.fdopen(fd, 'w') as f:
+            json.dump({'token': credentials.token, 'expiry': credentials.expiry.isoformat()}, f)
+        os.replace(tmp_path, path)
+    except OSError:
+        return
+
+@lru_cache(maxsize=None)
+def get_credentials() -> service_account.Credentials:
+    """ Loads the service account credentials, parsing the key file only on the first call
+
+    Sharing one credentials object also means the access token is only refreshed once per expiry,
+    rather than once per caller. The credentials start with the token from the token cache, if any,
+    and nothing is requested until they are first used.
+
+    Returns:
+        Google Credentials stored in the service-account-credential.json
+    """
+    credentials = CachedTokenCredentials.from_service_account_file(SERVICE_ACCOUNT_FILE, scopes=SCOPES)
+    load_cached_token(credentials)
+    return credentials